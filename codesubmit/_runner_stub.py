@@ -0,0 +1,97 @@
+"""
+Worker loop for executor.PersistentRunner.
+
+Reads one JSON request per line from stdin:
+{"path": ..., "stdin": ..., "stdout": ..., "stderr": ...}
+Runs the script as __main__ with its output written to the files named by
+"stdout"/"stderr" (null discards it), then writes one JSON reply per line
+to stdout: {"exit": ...}. The parent reads back only what it keeps, so
+output is never held in memory here.
+"""
+import atexit
+import io
+import json
+import os
+import runpy
+import sys
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+
+def exit_status(code) -> int:
+    """Maps a SystemExit code to a process exit status, like the interpreter does."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        # The OS keeps only the low byte: exit(256) is 0, exit(-1) is 255
+        return code & 0xFF
+    print(code, file=sys.stderr)
+    return 1
+
+def main():
+    # Keep private handles on the protocol pipes, then point fd 0/1 at devnull
+    # so scripts writing to the raw fds (or their own children) can't corrupt them.
+    # While a script runs, fds 1/2 are pointed at the requested output files instead.
+    proto_in = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+    proto_out = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+
+    base_modules = set(sys.modules)
+    # sys.path[0] is this stub's directory (codesubmit/); scripts must not
+    # be able to import the grader's own modules as if they were theirs.
+    base_path = list(sys.path[1:])
+    base_cwd = os.getcwd()
+
+    for line in proto_in:
+        req = json.loads(line)
+        path = req["path"]
+        # Capture at the fd level so os.write(1, ...) and child processes
+        # land in the files too, in the order they were written.
+        for fd, target in ((1, req["stdout"]), (2, req["stderr"])):
+            if target is None:
+                os.dup2(devnull, fd)
+                continue
+            target_fd = os.open(target, os.O_WRONLY | os.O_TRUNC)
+            os.dup2(target_fd, fd)
+            os.close(target_fd)
+        # Same stream types as `python -u`: unbuffered binary layer with .buffer
+        out = io.TextIOWrapper(io.FileIO(1, 'wb', closefd=False), encoding='utf-8', write_through=True)
+        err = io.TextIOWrapper(io.FileIO(2, 'wb', closefd=False), encoding='utf-8',
+                               errors='backslashreplace', write_through=True)
+
+        sys.stdin = io.TextIOWrapper(io.BytesIO(req["stdin"].encode('utf-8')), encoding='utf-8')
+        sys.argv = [path]
+        sys.path[:] = [os.path.dirname(path)] + base_path
+        exit_code = 0
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                runpy.run_path(path, run_name="__main__")
+            except SystemExit as e:
+                exit_code = exit_status(e.code)
+            except BaseException as e:
+                # Hide the runpy frames so it reads like a plain `python script.py`
+                tb = e.__traceback__
+                while tb is not None and tb.tb_frame.f_code.co_filename != path:
+                    tb = tb.tb_next
+                traceback.print_exception(type(e), e, tb or e.__traceback__)
+                exit_code = 1
+            # As at interpreter exit; this also clears the handlers for the next script
+            atexit._run_exitfuncs()
+            out.flush()
+            err.flush()
+
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+
+        # Start the next script from the same clean slate
+        for name in set(sys.modules) - base_modules:
+            del sys.modules[name]
+        os.chdir(base_cwd)
+
+        proto_out.write(json.dumps({"exit": exit_code}) + "\n")
+        proto_out.flush()
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,13 @@ class Config:
     timeout: int = 5
     stdin_input: str = ""
     interactive: bool = False
+    parallelism: Optional[int] = None
+    max_output_bytes: Optional[int] = 1_048_576
+    reuse_interpreter: bool = False
+    total_timeout: Optional[float] = None
+    discard_stdout: bool = False
+    discard_stderr: bool = False
+    spill_threshold: Optional[int] = None
 
 def load_config(path: str) -> Config:
     if not os.path.exists(path):
@@ -36,5 +43,12 @@ def load_config(path: str) -> Config:
         execution_enabled=exe.get("enabled", True),
         timeout=exe.get("timeout", 5),
         stdin_input=exe.get("stdin_input", ""),
-        interactive=exe.get("interactive", data.get("interactive", False))
+        interactive=exe.get("interactive", data.get("interactive", False)),
+        parallelism=exe.get("parallelism"),
+        max_output_bytes=exe.get("max_output_bytes", 1_048_576),
+        reuse_interpreter=exe.get("reuse_interpreter", False),
+        total_timeout=exe.get("total_timeout"),
+        discard_stdout=exe.get("discard_stdout", False),
+        discard_stderr=exe.get("discard_stderr", False),
+        spill_threshold=exe.get("spill_threshold")
     )
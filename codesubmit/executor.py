@@ -3,13 +3,138 @@ import time
 import os
 import sys
 import shlex
+import math
+import signal
 import threading
-from dataclasses import dataclass, field
-from typing import List, Tuple, Any, Dict, Optional
+import selectors
+import json
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from typing import List, Tuple, Any, Dict, Optional, Callable
 from .scanner import SourceFile
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+READ_CHUNK = 65536
+
+F_SETPIPE_SZ = 1031  # Linux-only; fcntl exposes it as a constant from 3.10
+
+def _max_pipe_size() -> int:
+    """
+    Pipe capacity to request for child stdio: 1 MiB, clamped to the
+    unprivileged limit in /proc/sys/fs/pipe-max-size. 0 means "leave as is".
+    """
+    if not sys.platform.startswith('linux'):
+        return 0
+    try:
+        with open('/proc/sys/fs/pipe-max-size') as f:
+            return min(1 << 20, int(f.read()))
+    except (OSError, ValueError):
+        return 0
+
+PIPE_SIZE = _max_pipe_size()
+
+# Shared spawn options for every submission process.
+# env is deliberately left as None: the child then inherits our environment
+# without Python building a new env block per spawn, and programs still see
+# the variables (HOME, JAVA_HOME, ...) they would in a terminal.
+# On Windows, close_fds=False skips building an explicit handle list for
+# CreateProcess; our own handles are non-inheritable (PEP 446) anyway.
+SPAWN_KWARGS = dict(close_fds=(os.name == 'posix'))
+# Each submission leads its own process group, so a timeout can take down
+# anything it spawned (shell pipelines, workers) and not just the leader.
+if os.name == 'posix':
+    SPAWN_KWARGS["start_new_session"] = True
+else:
+    SPAWN_KWARGS["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+
+def kill_process_group(proc, grace: float = 0.2):
+    """
+    Stops 'proc' and its process group: a polite signal first, then a hard
+    kill after 'grace' seconds. Reaps the leader before returning.
+    """
+    posix = os.name == 'posix'
+    try:
+        if posix:
+            # start_new_session makes the leader's pid the group id
+            os.killpg(proc.pid, signal.SIGTERM)
+        else:
+            proc.send_signal(signal.CTRL_BREAK_EVENT)
+    except OSError:
+        pass
+    try:
+        proc.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        # Always escalate on POSIX: children may outlive or ignore SIGTERM
+        if posix:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+    proc.wait()
+
+class ProcessTracker:
+    """
+    The live batch processes of one execute_files call. Their groups are
+    outside the terminal's foreground group, so Ctrl+C only reaches us and
+    kill_all() has to stop them.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._procs = set()
+        self._closed = False
+
+    def add(self, proc):
+        with self._lock:
+            if not self._closed:
+                self._procs.add(proc)
+                return
+        # Spawned after kill_all(): don't let it run on
+        kill_process_group(proc)
+
+    def discard(self, proc):
+        with self._lock:
+            self._procs.discard(proc)
+
+    def kill_all(self):
+        with self._lock:
+            self._closed = True
+            procs = list(self._procs)
+            self._procs.clear()
+        for proc in procs:
+            kill_process_group(proc)
+
+def grow_pipes(proc):
+    """
+    Best-effort enlargement of the child's pipes, for the interactive path only.
+    Popen(pipesize=...) is deliberately not used: it raises instead of ignoring
+    EPERM once the per-user pipe-buffer limit is spent, which a pool of batch
+    children can exhaust.
+    """
+    if not PIPE_SIZE or fcntl is None:
+        return
+    for p in (proc.stdin, proc.stdout, proc.stderr):
+        if p is None:
+            continue
+        try:
+            fcntl.fcntl(p.fileno(), F_SETPIPE_SZ, PIPE_SIZE)
+        except OSError:
+            pass
+
 @dataclass
 class ExecutionResult:
+    # Declared by hand since dataclass(slots=True) needs Python 3.10
+    # (so fields can't have defaults either; pass stdout_path explicitly)
+    __slots__ = ("stdout", "stderr", "exit_code", "duration", "command", "context", "timed_out", "stdout_path")
+
     stdout: str
     stderr: str
     exit_code: int
@@ -17,38 +142,380 @@ class ExecutionResult:
     command: str
     context: Dict[str, str]
     timed_out: bool
+    stdout_path: Optional[str]  # Full stdout on disk when it was spilled (see spill_threshold)
 
     def to_dict(self):
-        return {
-            "stdout": self.stdout,
-            "stderr": self.stderr,
-            "exit_code": self.exit_code,
-            "duration": self.duration,
-            "command": self.command,
-            "context": self.context,
-            "timed_out": self.timed_out
-        }
-
-def sys_python_executable():
-    import sys
-    return sys.executable
+        return {name: getattr(self, name) for name in _RESULT_FIELDS}
+
+_RESULT_FIELDS = tuple(f.name for f in fields(ExecutionResult))
+
+class BoundedSink:
+    """
+    Keeps only the last 'max_bytes' of the raw bytes appended to it.
+    Older data is dropped from the front and reported by getvalue(),
+    which decodes the tail once. A falsy 'max_bytes' disables the cap.
+    """
+    def __init__(self, max_bytes: Optional[int] = 1_048_576):
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._buf = deque()
+        self._size = 0
+        # stdout is fed by both the reader and the input threads.
+        self._lock = threading.Lock()
+
+    def skip(self, n: int):
+        """Records 'n' bytes that were dropped before reaching the sink."""
+        with self._lock:
+            self.dropped += n
+
+    def append(self, chunk: bytes):
+        with self._lock:
+            self._buf.append(chunk)
+            self._size += len(chunk)
+            if not self.max_bytes:
+                return
+            while self._size > self.max_bytes:
+                head = self._buf.popleft()
+                excess = self._size - self.max_bytes
+                if len(head) > excess:
+                    # Keep the tail of a partially dropped chunk
+                    self._buf.appendleft(head[excess:])
+                    head = head[:excess]
+                self._size -= len(head)
+                self.dropped += len(head)
+
+    def append_tail(self, f, limit: Optional[int]) -> int:
+        """
+        Appends the last 'limit' bytes of the open file 'f' (all of it if
+        'limit' is falsy) and records the rest as skipped. Returns the file size.
+        """
+        size = os.fstat(f.fileno()).st_size
+        skipped = max(0, size - limit) if limit else 0
+        self.skip(skipped)
+        f.seek(skipped)
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            self.append(chunk)
+        return size
+
+    def ends_with_newline(self) -> bool:
+        """True if the sink is empty or what it kept ends with a newline."""
+        with self._lock:
+            for chunk in reversed(self._buf):
+                if chunk:
+                    return chunk.endswith(b"\n")
+            return True
+
+    def getvalue(self) -> str:
+        with self._lock:
+            # A cut at the front may split a UTF-8 sequence; 'replace' covers it
+            body = b"".join(self._buf).decode('utf-8', errors='replace')
+            if self.dropped:
+                return f"[...truncated {self.dropped} bytes...]\n" + body
+            return body
+
+def echo_bytes(stream_dest, chunk: bytes):
+    """Writes raw child output to 'stream_dest', bypassing its text layer when it has one."""
+    raw = getattr(stream_dest, 'buffer', None)
+    if raw is None:
+        stream_dest.write(chunk.decode('utf-8', errors='replace'))
+        stream_dest.flush()
+        return
+    raw.write(chunk)
+    raw.flush()
 
 def stream_reader(pipe, out_buffer, stream_dest):
     """
-    Reads from 'pipe' line by line (or chunk).
-    Writes to 'out_buffer' (list of str).
+    Reads from binary 'pipe' in chunks until EOF.
+    Writes to 'out_buffer' (BoundedSink).
     Writes to 'stream_dest' (e.g. sys.stdout).
     """
+    # Push out pending text so it isn't overtaken by the raw writes below
+    stream_dest.flush()
     try:
-        # iter(pipe.readline, b'') works if pipe is binary
-        # If text mode, just pipe.readline
-        for line in iter(pipe.readline, ''):
-            out_buffer.append(line)
-            stream_dest.write(line)
-            stream_dest.flush()
+        for chunk in iter(lambda: pipe.read(READ_CHUNK), b''):
+            out_buffer.append(chunk)
+            echo_bytes(stream_dest, chunk)
     except (ValueError, OSError):
         pass
 
+def selectable_stdin() -> Optional[int]:
+    """
+    Returns our stdin's fd if a selector can watch it, else None.
+    Regular files (stdin redirected from disk) can't be registered with epoll.
+    """
+    try:
+        fd = sys.stdin.fileno()
+        with selectors.DefaultSelector() as probe:
+            probe.register(fd, selectors.EVENT_READ)
+    except (AttributeError, ValueError, OSError):
+        return None
+    return fd
+
+def pump_pipes(proc, streams, timeout, stdin_fd: Optional[int] = None, input_log=None,
+               stdin_data: Optional[bytes] = None) -> bool:
+    """
+    Single-threaded replacement for one stream_reader thread per pipe.
+    'streams' is a list of (pipe, out_buffer, stream_dest) tuples; a None
+    'stream_dest' captures without echoing.
+    Multiplexes all pipes with a selector until they hit EOF and the child
+    has exited (or it exits with nothing left to read). Returns True if
+    'timeout' expired first; a None timeout never expires.
+    If 'stdin_fd' is given, whatever arrives on it is forwarded to
+    proc.stdin (without ever blocking on it) and appended to 'input_log';
+    proc.stdin is closed on EOF and once the child exits, so no reader is
+    left blocked on the console. Alternatively, 'stdin_data' is written to
+    proc.stdin, which is then closed, as communicate() does.
+    POSIX only: Windows cannot select() on pipes.
+
+    DefaultSelector resolves to epoll on Linux, so each wakeup costs one
+    syscall for every ready pipe and reads are already 64 KiB. An io_uring
+    loop would save little on top of that for two pipes and would add a
+    third-party, Linux-only dependency, so it isn't used.
+    """
+    deadline = math.inf if timeout is None else time.monotonic() + timeout
+    sel = selectors.DefaultSelector()
+    for pipe, out_buffer, stream_dest in streams:
+        # Push out pending text so it isn't overtaken by the raw writes below
+        if stream_dest is not None:
+            stream_dest.flush()
+        sel.register(pipe, selectors.EVENT_READ, (out_buffer, stream_dest))
+    outputs = len(streams)
+    # Console input is queued in 'pending' and written to the child with
+    # non-blocking writes as it drains the pipe. A child that stops reading
+    # can then never block this loop past the deadline; while anything is
+    # queued we stop reading the console, so the queue stays small.
+    proxying = stdin_fd is not None
+    feeding = proxying or stdin_data is not None
+    pending = bytearray(stdin_data or b"")
+    watching = {"console": False, "child_stdin": False}
+    if feeding:
+        os.set_blocking(proc.stdin.fileno(), False)
+
+    def update_interest():
+        want = {"console": proxying and not pending, "child_stdin": feeding and bool(pending)}
+        fds = {"console": (stdin_fd, selectors.EVENT_READ),
+               "child_stdin": (proc.stdin, selectors.EVENT_WRITE)}
+        for name, on in want.items():
+            if on and not watching[name]:
+                sel.register(fds[name][0], fds[name][1], name)
+            elif watching[name] and not on:
+                sel.unregister(fds[name][0])
+            watching[name] = on
+
+    def close_child_stdin():
+        nonlocal feeding
+        if feeding:
+            feeding = False
+            pending.clear()
+            update_interest()
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    def stop_proxy():
+        nonlocal proxying
+        proxying = False
+        update_interest()
+        if not pending:
+            close_child_stdin()
+
+    if proxying:
+        update_interest()
+    else:
+        # No console: close proc.stdin as soon as 'stdin_data' is written
+        stop_proxy()
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            if not outputs and not proxying and not pending:
+                # Nothing left to shuttle; just wait for the child itself
+                try:
+                    proc.wait(timeout=None if remaining == math.inf else remaining)
+                except subprocess.TimeoutExpired:
+                    return True
+                break
+            # Short poll so we notice a child whose pipes were inherited by
+            # a lingering grandchild and never reach EOF.
+            events = sel.select(timeout=min(remaining, 0.1))
+            if proc.poll() is not None:
+                stop_proxy()
+                close_child_stdin()
+                if not outputs:
+                    break
+                if not events:
+                    # Pick up anything written just before the child exited.
+                    events = sel.select(timeout=0)
+                    if not events:
+                        break
+            for key, _ in events:
+                if key.data == "console":
+                    # Console input for the child
+                    if not watching["console"]:
+                        continue
+                    chunk = os.read(stdin_fd, 4096)
+                    if not chunk:
+                        stop_proxy()
+                        continue
+                    pending += chunk
+                    input_log.append(chunk) # Add USER INPUT to the captured log
+                    update_interest()
+                    continue
+                if key.data == "child_stdin":
+                    if not watching["child_stdin"]:
+                        continue
+                    try:
+                        written = os.write(proc.stdin.fileno(), pending[:READ_CHUNK])
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        # The child closed its stdin
+                        close_child_stdin()
+                        continue
+                    del pending[:written]
+                    if not pending and not proxying:
+                        close_child_stdin()
+                    update_interest()
+                    continue
+                out_buffer, stream_dest = key.data
+                chunk = os.read(key.fd, READ_CHUNK)
+                if not chunk:
+                    sel.unregister(key.fileobj)
+                    outputs -= 1
+                    continue
+                out_buffer.append(chunk)
+                if stream_dest is not None:
+                    echo_bytes(stream_dest, chunk)
+    finally:
+        proxying = False
+        close_child_stdin()
+        sel.close()
+    return False
+
+RUNNER_STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_runner_stub.py')
+
+class PersistentRunner:
+    """
+    A long-lived Python worker (see _runner_stub.py) that runs scripts
+    in-process, so a batch of small files pays interpreter startup once.
+    POSIX only: replies are awaited with a selector, which Windows pipes
+    don't support.
+    """
+    def __init__(self, py_exe: str):
+        self.py_exe = py_exe
+        self.proc = None
+
+    def run(self, path: str, stdin_content: bytes, timeout,
+            stdout_sink: Optional[BoundedSink] = None,
+            stderr_sink: Optional[BoundedSink] = None) -> Optional[int]:
+        """
+        Runs 'path' in the worker and returns its exit code, or None if the
+        worker crashed (the caller should fall back to a fresh process).
+        The script writes to temp files owned by this side; only the last
+        'max_bytes' of each are read into its sink, and a None sink sends
+        that stream to devnull. Raises subprocess.TimeoutExpired after
+        killing a worker that overran, with its partial output already in
+        the sinks; a None timeout waits indefinitely.
+        """
+        if self.proc is None or self.proc.poll() is not None:
+            self.proc = subprocess.Popen(
+                [self.py_exe, '-u', RUNNER_STUB],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                **SPAWN_KWARGS
+            )
+        sinks = (stdout_sink, stderr_sink)
+        files = [
+            None if sink is None else
+            tempfile.NamedTemporaryFile(prefix='codesubmit-', suffix='.out', delete=False)
+            for sink in sinks
+        ]
+
+        def collect():
+            for sink, f in zip(sinks, files):
+                if f is not None:
+                    sink.append_tail(f, sink.max_bytes)
+
+        try:
+            request = {
+                "path": path,
+                "stdin": stdin_content.decode('utf-8', errors='replace'),
+                "stdout": files[0] and files[0].name,
+                "stderr": files[1] and files[1].name
+            }
+            deadline = math.inf if timeout is None else time.monotonic() + timeout
+            try:
+                self.proc.stdin.write(json.dumps(request).encode('utf-8') + b"\n")
+                self.proc.stdin.flush()
+            except OSError:
+                self.close()
+                return None
+
+            reply = bytearray()
+            fd = self.proc.stdout.fileno()
+            with selectors.DefaultSelector() as sel:
+                sel.register(fd, selectors.EVENT_READ)
+                while not reply.endswith(b"\n"):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.close()
+                        collect()
+                        raise subprocess.TimeoutExpired([self.py_exe, '-u', path], timeout)
+                    if not sel.select(timeout=None if remaining == math.inf else remaining):
+                        continue
+                    chunk = os.read(fd, READ_CHUNK)
+                    if not chunk:
+                        self.close()
+                        return None
+                    reply += chunk
+            collect()
+            return json.loads(reply)["exit"]
+        finally:
+            for f in files:
+                if f is not None:
+                    f.close()
+                    os.remove(f.name)
+
+    def close(self):
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            # Also takes down anything the running script spawned
+            kill_process_group(self.proc)
+        self.proc.wait()
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+        self.proc = None
+
+class PersistentRunnerPool:
+    """Hands each worker thread its own PersistentRunner."""
+    def __init__(self, py_exe: str):
+        self.py_exe = py_exe
+        self._local = threading.local()
+        self._runners = []
+
+    def get(self) -> PersistentRunner:
+        runner = getattr(self._local, "runner", None)
+        if runner is None:
+            runner = PersistentRunner(self.py_exe)
+            self._local.runner = runner
+            self._runners.append(runner)
+        return runner
+
+    def kill(self):
+        """Kills busy workers' process groups; their threads then see EOF and clean up."""
+        for runner in self._runners:
+            proc = runner.proc
+            if proc is not None and proc.poll() is None:
+                kill_process_group(proc)
+
+    def close(self):
+        for runner in self._runners:
+            runner.close()
+
 def get_java_class_name(file_path: str) -> Optional[str]:
     """
     detects package name from file content and returns 'package.ClassName'.
@@ -77,13 +544,355 @@ def compile_java_project(root_dir: str):
     # We'll run javac on specific files found by scanner?
     pass # Implemented inline in execute_files
 
-def execute_files(files: List[SourceFile], config) -> List[Tuple[SourceFile, Optional[ExecutionResult]]]:
-    results = []
+def _java_command(file_path: str) -> List[str]:
+    # Run the CLASS file, not the source file.
+    # Convert file path to class name
+    full_class = get_java_class_name(file_path)
+    if full_class:
+        # We need to set the classpath
+        # If file is D:\...\src\Workshop3\Task.java and package is Workshop3,
+        # we need to run java -cp D:\...\src Workshop3.Task
+
+        # Determine classpath: it's the folder containing the top package.
+        # If package is "Workshop3", we look for "Workshop3" in the path.
+
+        parts = full_class.split('.')
+        # If we have package "a.b", we expect path to end in "a/b/File.java"
+
+        # Naive approach: use the config input root's parent? 
+        # If the user pointed to ".../src/Workshop3" and package is "Workshop3",
+        # valid CP is ".../src".
+
+        source_root = os.path.dirname(file_path) # Default
+        if '.' in full_class:
+            pkg_path = full_class.rsplit('.', 1)[0].replace('.', os.sep)
+            if file_path.endswith(pkg_path + os.sep + os.path.basename(file_path)):
+                 # E.g. path matches package structure
+                 # CP is path minus package suffix
+                 trim_len = len(pkg_path) + len(os.path.basename(file_path)) + 1
+                 source_root = file_path[:-trim_len]
+
+        return ['java', '-cp', source_root, full_class]
+    else:
+         # Fallback to single-file mode if no class detected
+         return ['java', file_path]
+
+_PY = sys.executable
+
+# Language -> command builder. Register new languages here.
+_RUNNERS: Dict[str, Callable[[str], List[str]]] = {
+    'Python': lambda p: [_PY, '-u', p],
+    'Java': _java_command,
+}
+
+def _no_runner(file_path: str) -> List[str]:
+    return []
+
+def get_runner_command(file_path: str, language: str) -> List[str]:
+    """Returns the command used to run 'file_path', or [] if no runner exists."""
+    return _RUNNERS.get(language, _no_runner)(file_path)
+
+def _run_batch(cmd: List[str], config, stdin_content: bytes, timeout, has_input_file: bool,
+               stdout_sink: BoundedSink, stderr_sink: BoundedSink,
+               live: Optional[ProcessTracker] = None) -> Tuple[int, Optional[str]]:
+    """
+    Runs 'cmd' to completion in a fresh process, capturing its output into
+    the sinks. Streams the config discards go to DEVNULL.
+    On POSIX the pipes are drained by pump_pipes straight into the sinks, so
+    'max_output_bytes' bounds memory as well as the report; Windows falls
+    back to communicate(), which holds all of it until the child exits.
+    With 'spill_threshold' set, stdout goes straight to a temp file and only
+    its last 'spill_threshold' bytes are read back. The file is kept only if
+    output exceeded that.
+    Returns (exit code, spilled stdout path or None). On timeout the group is
+    killed and TimeoutExpired raised, with the partial output in the sinks.
+    The process is registered with 'live' while it runs.
+    """
+    # An input fixture is handed to the child as an open fd so the kernel
+    # streams it into the pipe; it is never read into memory here.
+    stdin_file = None
+    if has_input_file:
+        stdin_file = open(config.input_file, 'rb')
+    stdin_data = None if stdin_file is not None else stdin_content
+    spill_file = None
+    if config.spill_threshold and not config.discard_stdout:
+        spill_file = tempfile.NamedTemporaryFile(prefix='codesubmit-', suffix='.stdout', delete=False)
+    if spill_file is not None:
+        stdout_target = spill_file
+    elif config.discard_stdout:
+        stdout_target = subprocess.DEVNULL
+    else:
+        stdout_target = subprocess.PIPE
+    try:
+        with subprocess.Popen(
+            cmd,
+            stdin=stdin_file if stdin_file is not None else subprocess.PIPE,
+            stdout=stdout_target,
+            stderr=subprocess.DEVNULL if config.discard_stderr else subprocess.PIPE,
+            **SPAWN_KWARGS
+        ) as proc:
+            # Same as subprocess.run, except a timeout kills the whole group;
+            # killing only the leader would leave the reads waiting on pipes
+            # still held open by its children.
+            if live is not None:
+                live.add(proc)
+            try:
+                if os.name == 'posix':
+                    streams = [
+                        (pipe, sink, None)
+                        for pipe, sink in ((proc.stdout, stdout_sink), (proc.stderr, stderr_sink))
+                        if pipe is not None
+                    ]
+                    if pump_pipes(proc, streams, timeout, stdin_data=stdin_data):
+                        kill_process_group(proc)
+                        raise subprocess.TimeoutExpired(cmd, timeout)
+                    proc.wait()
+                else:
+                    expired = False
+                    try:
+                        stdout, stderr = proc.communicate(stdin_data, timeout=timeout)
+                    except subprocess.TimeoutExpired:
+                        kill_process_group(proc)
+                        # Reader threads must be joined (as subprocess.run does)
+                        stdout, stderr = proc.communicate()
+                        expired = True
+                    stdout_sink.append(stdout or b"")
+                    stderr_sink.append(stderr or b"")
+                    if expired:
+                        raise subprocess.TimeoutExpired(cmd, timeout)
+            except subprocess.TimeoutExpired:
+                # The group is already gone
+                raise
+            except BaseException:
+                kill_process_group(proc)
+                raise
+            finally:
+                if live is not None:
+                    live.discard(proc)
+    except BaseException as e:
+        if spill_file is not None:
+            with spill_file:
+                if isinstance(e, subprocess.TimeoutExpired):
+                    # Keep what the child printed before it was killed
+                    stdout_sink.append_tail(spill_file, config.spill_threshold)
+            os.remove(spill_file.name)
+        raise
+    finally:
+        if stdin_file is not None:
+            stdin_file.close()
+
+    stdout_path = None
+    if spill_file is not None:
+        with spill_file:
+            size = stdout_sink.append_tail(spill_file, config.spill_threshold)
+        if size > config.spill_threshold:
+            stdout_path = spill_file.name
+        else:
+            os.remove(spill_file.name)
+    return proc.returncode, stdout_path
+
+def _run_one(file: SourceFile, config, stdin_content: bytes, timeout, context: Dict[str, str],
+             warm_pool: Optional[PersistentRunnerPool] = None,
+             deadline: float = math.inf,
+             live: Optional[ProcessTracker] = None) -> Tuple[SourceFile, Optional[ExecutionResult]]:
+    """
+    Builds the runner command for a single file and executes it.
+    'deadline' (time.monotonic() based) caps 'timeout' for the whole run.
+    Batch processes are registered with 'live' while they run.
+    """
+    cmd = get_runner_command(file.path, file.language)
+    cmd_str = shlex.join(cmd)
+
+    if not cmd:
+        print(f"Skipping execution for {file.rel_path} ({file.language}): No runner defined.")
+        return file, None
+
+    remaining = max(0.0, deadline - time.monotonic())
+    if remaining == 0:
+        print(f"Skipping execution for {file.rel_path}: global deadline exceeded.")
+        return file, ExecutionResult(
+            stdout="",
+            stderr="global deadline exceeded",
+            exit_code=-1,
+            duration=0.0,
+            command=cmd_str,
+            context=context,
+            timed_out=True,
+            stdout_path=None
+        )
+    # A None timeout means unlimited; only the global deadline can bound it
+    if timeout is None:
+        timeout = None if remaining == math.inf else remaining
+    else:
+        timeout = min(timeout, remaining)
+
+    print(f"\n--- Executing {file.rel_path} ---")
+    start_time = time.monotonic()
+
+    timed_out = False
+    stdout_path = None
+    captured_stdout = BoundedSink(config.max_output_bytes)
+    captured_stderr = BoundedSink(config.max_output_bytes)
+    exit_code = 0
     
+    try:
+        if config.interactive:
+            # INTERACTIVE MODE: Full Session Capture
+            # We need to capture what the user types AND what the program outputs.
+            # Previous attempt (stdin=sys.stdin) bypassed capture.
+            # New plan:
+            # 1. Main thread: Select on process stdout+stderr -> Print to Console + Append to Log
+            #    (Windows can't select() on pipes, so it falls back to one stream_reader thread each)
+            # 2. Input thread: Read Console stdin -> Write to Process stdin + Append to Log
+            
+            # Note: Reading sys.stdin on Windows can be blocking.
+            # However, since we are in "Interactive Mode", blocking on user input is EXPECTED behavior.
+            # We essentially act as a proxy.
+            
+            proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE, # We will write to this
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=0, # Raw pipes: read whatever is available in big chunks
+                **SPAWN_KWARGS
+            )
+            # Bigger pipes let chatty children run ahead of the reader threads.
+            grow_pipes(proc)
+            
+            # Shared log for chronological order (optional, but nice)
+            # For now, we append input to captured_stdout to make it look like a terminal session.
+            
+            # Actually, 'msvcrt' is low level console.
+            # Simpler: Just run a thread that reads input() and writes line-by-line?
+            # Does that show characters as they are typed? Yes, the terminal handles echo.
+            # On POSIX the console is normally proxied by pump_pipes instead; the thread
+            # is only used where stdin can't be selected (Windows, stdin from a file).
+            
+            def input_thread_func():
+                try:
+                    while proc.poll() is None:
+                        # Use input() to block wait for line?
+                        # If we block, we can't exit when proc dies?
+                        # Thread will die when daemonized?
+                        line = sys.stdin.readline()
+                        if not line: break
+                        
+                        try:
+                            data = line.encode('utf-8')
+                            proc.stdin.write(data)
+                            captured_stdout.append(data) # Add USER INPUT to the captured log
+                        except IOError:
+                            break
+                except:
+                    pass
+
+            def start_input_thread():
+                t_in = threading.Thread(target=input_thread_func)
+                t_in.daemon = True # Die when main dies
+                t_in.start()
+
+            streams = [
+                (proc.stdout, captured_stdout, sys.stdout),
+                (proc.stderr, captured_stderr, sys.stderr),
+            ]
+            try:
+                stdin_fd = selectable_stdin() if os.name == 'posix' else None
+                if stdin_fd is None:
+                    start_input_thread()
+                if os.name == 'posix':
+                    timed_out = pump_pipes(proc, streams, timeout, stdin_fd, captured_stdout)
+                    if timed_out:
+                        kill_process_group(proc)
+                    proc.wait()
+                else:
+                    readers = [threading.Thread(target=stream_reader, args=st) for st in streams]
+                    for t in readers:
+                        t.start()
+
+                    try:
+                        proc.wait(timeout=timeout)
+                    except subprocess.TimeoutExpired:
+                        kill_process_group(proc)
+                        timed_out = True
+
+                    for t in readers:
+                        t.join(timeout=1)
+            except BaseException:
+                # The child runs in its own session, so Ctrl+C no longer reaches it
+                kill_process_group(proc)
+                raise
+            # A fallback t_in might still be blocked on readline, but daemon=True handles it.
+            
+            exit_code = proc.returncode
+
+        else:
+            # BATCH MODE
+            has_input_file = bool(config.input_file and os.path.exists(config.input_file))
+            # A per-file timeout, possibly shortened by the global deadline,
+            # is reported the same way as files skipped after that deadline.
+            try:
+                warm_exit = None
+                if (warm_pool is not None and file.language == 'Python'
+                        and not has_input_file and not config.spill_threshold):
+                    warm_exit = warm_pool.get().run(
+                        file.path, stdin_content, timeout,
+                        None if config.discard_stdout else captured_stdout,
+                        None if config.discard_stderr else captured_stderr
+                    )
+
+                if warm_exit is not None:
+                    exit_code = warm_exit
+                else:
+                    exit_code, stdout_path = _run_batch(
+                        cmd, config, stdin_content, timeout, has_input_file,
+                        captured_stdout, captured_stderr, live
+                    )
+                    if stdout_path:
+                        print(f"Full stdout of {file.rel_path} ({os.path.getsize(stdout_path)} bytes) saved to {stdout_path}")
+            except subprocess.TimeoutExpired as e:
+                timed_out = True
+                exit_code = -1
+                # Whatever was read before the kill is already in the sinks
+                if not captured_stderr.ends_with_newline():
+                    captured_stderr.append(b"\n")
+                captured_stderr.append(str(e).encode('utf-8'))
+        
+        duration = time.monotonic() - start_time
+        
+        res = ExecutionResult(
+            stdout=captured_stdout.getvalue(),
+            stderr=captured_stderr.getvalue(),
+            exit_code=exit_code if exit_code is not None else -1,
+            duration=duration,
+            command=cmd_str,
+            context=context,
+            timed_out=timed_out,
+            stdout_path=stdout_path
+        )
+        
+    except Exception as e:
+        duration = time.monotonic() - start_time
+        res = ExecutionResult(
+            stdout=captured_stdout.getvalue(),
+            stderr=str(e),
+            exit_code=-1,
+            duration=duration,
+            command=cmd_str,
+            context=context,
+            timed_out=False,
+            stdout_path=None
+        )
+
+    return file, res
+
+def execute_files(files: List[SourceFile], config) -> List[Tuple[SourceFile, Optional[ExecutionResult]]]:
     if not config.execution_enabled:
         return [(f, None) for f in files]
 
     timeout = config.timeout
+    # Bounds the whole call, compilation included, not just each child
+    deadline = time.monotonic() + config.total_timeout if config.total_timeout else math.inf
     
     # JAVA PRE-COMPILATION STEP
     java_files = [f for f in files if f.language == 'Java']
@@ -132,171 +941,45 @@ def execute_files(files: List[SourceFile], config) -> List[Tuple[SourceFile, Opt
         except Exception as e:
              print(f"Warning: Compilation step failed: {e}")
 
-    for file in files:
-        cmd = []
-        if file.language == 'Python':
-            cmd = [sys_python_executable(), '-u', file.path]
-        elif file.language == 'Java':
-            # Run the CLASS file, not the source file.
-            # Convert file path to class name
-            full_class = get_java_class_name(file.path)
-            if full_class:
-                # We need to set the classpath
-                # If file is D:\...\src\Workshop3\Task.java and package is Workshop3,
-                # we need to run java -cp D:\...\src Workshop3.Task
-                
-                # Determine classpath: it's the folder containing the top package.
-                # If package is "Workshop3", we look for "Workshop3" in the path.
-                
-                parts = full_class.split('.')
-                # If we have package "a.b", we expect path to end in "a/b/File.java"
-                
-                # Naive approach: use the config input root's parent? 
-                # If the user pointed to ".../src/Workshop3" and package is "Workshop3",
-                # valid CP is ".../src".
-                
-                source_root = os.path.dirname(file.path) # Default
-                if '.' in full_class:
-                    pkg_path = full_class.rsplit('.', 1)[0].replace('.', os.sep)
-                    if file.path.endswith(pkg_path + os.sep + os.path.basename(file.path)):
-                         # E.g. path matches package structure
-                         # CP is path minus package suffix
-                         trim_len = len(pkg_path) + len(os.path.basename(file.path)) + 1
-                         source_root = file.path[:-trim_len]
-                
-                cmd = ['java', '-cp', source_root, full_class]
-            else:
-                 # Fallback to single-file mode if no class detected
-                 cmd = ['java', file.path]
-                 
-        if not cmd:
-            print(f"Skipping execution for {file.rel_path} ({file.language}): No runner defined.")
-            results.append((file, None))
-            continue
+    # Everything below is invariant across files, so resolve it once up front.
+    stdin_content = config.stdin_input.encode('utf-8') if config.stdin_input else b""
+    # Shared read-only by every result; nothing mutates it per file.
+    context = {
+        "cwd": os.getcwd(),
+        "env_user": os.environ.get("USERNAME", "unknown"),
+        "env_os": os.name
+    }
 
-        print(f"\n--- Executing {file.rel_path} ---")
-        start_time = time.time()
-        
-        context = {
-            "cwd": os.getcwd(),
-            "env_user": os.environ.get("USERNAME", "unknown"),
-            "env_os": os.name
-        }
-
-        timed_out = False
-        captured_stdout = []
-        captured_stderr = []
-        exit_code = 0
-        
-        try:
-            if config.interactive:
-                # INTERACTIVE MODE: Full Session Capture
-                # We need to capture what the user types AND what the program outputs.
-                # Previous attempt (stdin=sys.stdin) bypassed capture.
-                # New plan:
-                # 1. Thread 1: Read process stdout -> Print to Console + Append to Log
-                # 2. Thread 2: Read process stderr -> Print to Console + Append to Log
-                # 3. Thread 3 (Main): Read Console stdin -> Write to Process stdin + Append to Log
-                
-                # Note: Reading sys.stdin on Windows can be blocking.
-                # However, since we are in "Interactive Mode", blocking on user input is EXPECTED behavior.
-                # We essentially act as a proxy.
-                
-                proc = subprocess.Popen(
-                    cmd,
-                    stdin=subprocess.PIPE, # We will write to this
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    bufsize=1, # Line buffered
-                    errors='replace'
-                )
-                
-                # Shared log for chronological order (optional, but nice)
-                # For now, we append input to captured_stdout to make it look like a terminal session.
-                
-                # Actually, 'msvcrt' is low level console.
-                # Simpler: Just run a thread that reads input() and writes line-by-line?
-                # Does that show characters as they are typed? Yes, the terminal handles echo.
-                
-                def input_thread_func():
-                    try:
-                        while proc.poll() is None:
-                            # Use input() to block wait for line?
-                            # If we block, we can't exit when proc dies?
-                            # Thread will die when daemonized?
-                            line = sys.stdin.readline()
-                            if not line: break
-                            
-                            try:
-                                proc.stdin.write(line)
-                                proc.stdin.flush()
-                                captured_stdout.append(line) # Add USER INPUT to the captured log
-                            except IOError:
-                                break
-                    except:
-                        pass
+    def run(f, warm_pool=None, live=None):
+        return _run_one(f, config, stdin_content, timeout, context, warm_pool, deadline, live)
 
-                t_in = threading.Thread(target=input_thread_func)
-                t_in.daemon = True # Die when main dies
-                t_in.start()
+    if config.interactive:
+        # Interactive mode proxies the real TTY, so files must run one at a time.
+        return [run(f) for f in files]
+
+    # BATCH MODE: each run spends nearly all its time blocked on the child,
+    # so a thread pool overlaps them. Results are collected in input order.
+    max_workers = config.parallelism or os.cpu_count() or 1
+    warm_pool = None
+    if config.reuse_interpreter and os.name == 'posix':
+        warm_pool = PersistentRunnerPool(_PY)
+    live = ProcessTracker()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            futures = [ex.submit(run, f, warm_pool, live) for f in files]
+            try:
+                results = [fut.result() for fut in futures]
+            except BaseException:
+                # Children run in their own sessions, so Ctrl+C never reached
+                # them; stop them here or leaving the pool would wait them out.
+                for fut in futures:
+                    fut.cancel()
+                live.kill_all()
+                if warm_pool is not None:
+                    warm_pool.kill()
+                raise
+    finally:
+        if warm_pool is not None:
+            warm_pool.close()
 
-                t_out = threading.Thread(target=stream_reader, args=(proc.stdout, captured_stdout, sys.stdout))
-                t_err = threading.Thread(target=stream_reader, args=(proc.stderr, captured_stderr, sys.stderr))
-                
-                t_out.start()
-                t_err.start()
-                
-                try:
-                    proc.wait(timeout=timeout)
-                except subprocess.TimeoutExpired:
-                    proc.kill()
-                    timed_out = True
-                
-                t_out.join(timeout=1)
-                t_err.join(timeout=1)
-                # t_in might still be blocked on readline, but daemon=True handles it.
-                
-                exit_code = proc.returncode
-
-            else:
-                # BATCH MODE
-                stdin_content = config.stdin_input.encode('utf-8') if config.stdin_input else b""
-                proc = subprocess.run(
-                    cmd,
-                    input=stdin_content,
-                    capture_output=True,
-                    timeout=timeout,
-                    check=False
-                )
-                captured_stdout = [proc.stdout.decode('utf-8', errors='replace')]
-                captured_stderr = [proc.stderr.decode('utf-8', errors='replace')]
-                exit_code = proc.returncode
-            
-            duration = time.time() - start_time
-            
-            res = ExecutionResult(
-                stdout="".join(captured_stdout),
-                stderr="".join(captured_stderr),
-                exit_code=exit_code if exit_code is not None else -1,
-                duration=duration,
-                command=shlex.join(cmd),
-                context=context,
-                timed_out=timed_out
-            )
-            
-        except Exception as e:
-            duration = time.time() - start_time
-            res = ExecutionResult(
-                stdout="".join(captured_stdout),
-                stderr=str(e),
-                exit_code=-1,
-                duration=duration,
-                command=shlex.join(cmd),
-                context=context,
-                timed_out=False
-            )
-            
-        results.append((file, res))
-        
     return results